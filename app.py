@@ -8,136 +8,178 @@ except AttributeError:
     # This might fail in some environments (e.g., non-console)
     pass
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, send_from_directory
 from flask_cors import CORS
-import os, tempfile
+import os
+import json
+import hashlib
+from collections import OrderedDict
 from pathlib import Path
-import pandas as pd
+import threading
 import traceback
+from contextlib import contextmanager
+import logging
+from logging.handlers import MemoryHandler
+from etl_pipeline import ETLPipeline
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import fcntl
+except ImportError:  # Windows has no gunicorn; the thread lock is enough there
+    fcntl = None
 
 app = Flask(__name__)
 CORS(app)
+
+# Request logging goes through a MemoryHandler so per-request lines are
+# written to stderr in batches; anything at ERROR flushes the buffer at once
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.environ.get('ETL_DEBUG') else logging.INFO)
+logger.addHandler(MemoryHandler(capacity=1024, flushLevel=logging.ERROR,
+                                target=logging.StreamHandler()))
+logger.propagate = False
 Path('inputs').mkdir(exist_ok=True)
 Path('outputs').mkdir(exist_ok=True)
 
+@contextmanager
+def outputs_lock():
+    """Hold an exclusive lock on outputs/ shared by all worker processes"""
+    with open(Path('outputs') / '.lock', 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield  # closing the file releases the lock
+
+# One pipeline for the whole process. Flask serves requests on several
+# threads and the pipeline keeps per-run state, so runs are serialized
+# with a lock. Under gunicorn several processes write the same outputs/
+# files, so the writes themselves also take a file lock; that keeps each
+# set of output files from a single run.
+_PIPELINE = ETLPipeline(input_dir='inputs', output_dir='outputs', output_lock=outputs_lock)
+_PIPELINE_LOCK = threading.Lock()
+
+# Encoded /process responses for recently seen payloads, keyed by a BLAKE2
+# digest of the request body, so re-uploading a file skips the pipeline
+_RESPONSE_CACHE = OrderedDict()
+_RESPONSE_CACHE_SIZE = 64
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def encode_json(payload):
+    """Serialize an API payload to bytes, with orjson when it is installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=str,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass  # e.g. an integer wider than 64 bits; stdlib json handles it
+    return json.dumps(payload, default=str).encode('utf-8')
+
+def json_response(payload, status=200):
+    """Build a raw application/json response for an API payload"""
+    return Response(encode_json(payload), status=status, mimetype='application/json')
+
+def get_cached_response(key):
+    """Return the encoded response stored for key, or None"""
+    with _RESPONSE_CACHE_LOCK:
+        encoded = _RESPONSE_CACHE.get(key)
+        if encoded is not None:
+            _RESPONSE_CACHE.move_to_end(key)
+        return encoded
+
+def cache_response(key, encoded):
+    """Store an encoded response, evicting the least recently used"""
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = encoded
+        _RESPONSE_CACHE.move_to_end(key)
+        while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_SIZE:
+            _RESPONSE_CACHE.popitem(last=False)
+
+# Static pages go through send_from_directory, which streams the file
+# (sendfile where the server supports it) and answers ETag/304 revalidation
 @app.route('/', methods=['GET'])
 def index():
     """Serves the main index.html frontend"""
-    try:
-        with open('index.html', encoding='utf-8') as f:
-            return f.read(), 200, {'Content-Type': 'text/html; charset=utf-8'}
-    except FileNotFoundError:
-        print("ERROR: index.html not found!", flush=True)
-        return "Error: index.html not found. Please ensure it's in the same directory.", 404
+    return send_from_directory(app.root_path, 'index.html', max_age=3600)
 
 @app.route('/diagnostic.html', methods=['GET'])
 def diagnostic():
     """Serves the diagnostic.html test page"""
-    try:
-        with open('diagnostic.html', encoding='utf-8') as f:
-            return f.read(), 200, {'Content-Type': 'text/html; charset=utf-8'}
-    except FileNotFoundError:
-        return "diagnostic.html not found", 404
+    return send_from_directory(app.root_path, 'diagnostic.html', max_age=3600)
 
 @app.route('/console_test.html', methods=['GET'])
 def console_test():
     """Serves the console_test.html test page"""
-    try:
-        with open('console_test.html', encoding='utf-8') as f:
-            return f.read(), 200, {'Content-Type': 'text/html; charset=utf-8'}
-    except FileNotFoundError:
-        return "console_test.html not found", 404
+    return send_from_directory(app.root_path, 'console_test.html', max_age=3600)
 
 @app.route('/process', methods=['POST'])
 def process():
     """Main API endpoint for processing data"""
     try:
-        # Import the pipeline *inside* the endpoint.
-        # This ensures any changes to etl_pipeline.py are picked up if reloader is used,
-        # and it contains the import to the part of the code that needs it.
-        from etl_pipeline import ETLPipeline
-        
-        content = request.get_data(as_text=True)
-        if not content.strip():
-            return jsonify({'error': 'No data provided'}), 400
+        body = request.get_data()
+        if not body.strip():
+            return json_response({'error': 'No data provided'}, 400)
         
-        # Write content to a temporary file with UTF-8 encoding
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', dir='inputs', delete=False, encoding='utf-8') as f:
-            f.write(content)
-            fname = os.path.basename(f.name)
+        cache_key = hashlib.blake2b(body, digest_size=16).digest()
+        cached = get_cached_response(cache_key)
+        if cached is not None:
+            logger.debug("Payload seen before, serving cached result")
+            return Response(cached, status=200, mimetype='application/json')
         
-        print(f"DEBUG: Processing temporary file {fname}", flush=True)
+        logger.debug("Processing %d bytes in memory", len(body))
         
-        pipeline = ETLPipeline(input_dir='inputs', output_dir='outputs')
-        df, schema = pipeline.run(fname)
+        # Invalid UTF-8 bytes are replaced, as get_data(as_text=True) would
+        with _PIPELINE_LOCK:
+            df, schema = _PIPELINE.run_bytes(body, errors='replace')
         
-        print(f"DEBUG: Pipeline run complete. {len(df)} records.", flush=True)
+        logger.debug("Pipeline run complete. %d records.", len(df))
         
         # --- Type Inference and Data Serialization Logic ---
         # This logic is crucial for the frontend to display types correctly
         
+        # Classify from the dtype kind; only object columns need a look at
+        # an actual value (their first non-null one)
         column_types = {}
-        for col in df.columns:
-            non_null_values = df[col].dropna()
-            
-            if len(non_null_values) == 0:
+        non_null_counts = df.count()
+        for col, kind in df.dtypes.map(lambda dtype: dtype.kind).items():
+            if non_null_counts[col] == 0:
                 column_types[col] = 'string' # Default for all-NaN columns
-            elif non_null_values.apply(lambda x: isinstance(x, (list, tuple))).any():
-                column_types[col] = 'array'
-            elif pd.api.types.is_bool_dtype(non_null_values) or all(isinstance(v, bool) for v in non_null_values):
-                column_types[col] = 'boolean'
-            elif pd.api.types.is_numeric_dtype(non_null_values):
+            elif kind in 'iufc':
                 column_types[col] = 'number'
-            elif pd.api.types.is_datetime64_any_dtype(non_null_values):
+            elif kind == 'b':
+                column_types[col] = 'boolean'
+            elif kind == 'M':
                 column_types[col] = 'datetime'
             else:
-                column_types[col] = 'string'
-        
-        print(f"DEBUG - Column types detected: {column_types}", flush=True)
-        
-        # Convert DataFrame to a list of records (dicts) for JSON
-        # This handles NaN/NaT values correctly for JSON serialization
-        data = []
-        for _, row in df.iterrows():
-            record = {}
-            for col in df.columns:
-                val = row[col]
-                
-                # Handle lists/arrays first
-                if isinstance(val, (list, tuple)):
-                    record[col] = val
-                # Check for NaN/NaT (which are not JSON-safe)
-                elif pd.isna(val):
-                    record[col] = None # Convert to null
-                # Handle boolean explicitly
-                elif isinstance(val, bool):
-                    record[col] = val
-                # Handle numeric types (int, float)
-                elif isinstance(val, (int, float)):
-                    record[col] = val
-                # Convert all other types to string
+                first = df.at[df[col].first_valid_index(), col]
+                if isinstance(first, (list, tuple)):
+                    column_types[col] = 'array'
+                elif isinstance(first, bool):
+                    column_types[col] = 'boolean'
                 else:
-                    record[col] = str(val)
-            data.append(record)
+                    column_types[col] = 'string'
         
-        # Clean up the temporary file
-        try:
-            os.remove(os.path.join('inputs', fname))
-            print(f"DEBUG: Cleaned up temporary file {fname}", flush=True)
-        except Exception as e:
-            print(f"WARNING: Could not remove temp file {fname}: {e}", flush=True)
+        logger.debug("Column types detected: %s", column_types)
+        
+        # Convert DataFrame to a list of records (dicts) for JSON. NaN/NaT
+        # are masked to None for the whole frame at once, so no per-cell
+        # pd.isna check or JSON encode/decode round trip is needed.
+        data = df.astype(object).where(df.notna(), None).to_dict('records')
         
         # Return the complete response
-        return jsonify({
+        encoded = encode_json({
             'success': True, 
             'data': data,         # The processed data rows
             'types': column_types # The inferred schema types
-        }), 200
+        })
+        cache_response(cache_key, encoded)
+        return Response(encoded, status=200, mimetype='application/json')
         
     except Exception as e:
-        print(f"ERROR in process(): {str(e)}", flush=True)
-        print(traceback.format_exc(), flush=True)
-        return jsonify({'error': str(e), 'trace': traceback.format_exc()}), 500
+        logger.exception("ERROR in process(): %s", e)
+        return json_response({'error': str(e), 'trace': traceback.format_exc()}, 500)
 
 if __name__ == '__main__':
     print("="*60, flush=True)
@@ -1,46 +1,74 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import sys
 import traceback
-import tempfile
 import os
-import json
+import logging
+from logging.handlers import MemoryHandler
 from pathlib import Path
 import pandas as pd
+import threading
+from etl_pipeline import ETLPipeline
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to Flask's encoder
+    orjson = None
 
 app = Flask(__name__)
 CORS(app)
 
-# Configure JSON encoder to handle special values
-class SafeJSONEncoder(json.JSONEncoder):
-    def default(self, obj):
-        try:
-            if pd.isna(obj):
-                return None
-        except:
-            pass
-        return super().default(obj)
+def _json_default(obj):
+    """Encode values JSON has no type for: NaN/NaT become null, rest str"""
+    try:
+        if pd.isna(obj):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return str(obj)
+
+# Configure JSON provider to handle special values
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            try:
+                return orjson.dumps(
+                    obj,
+                    default=_json_default,
+                    option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+                ).decode()
+            except TypeError:
+                pass  # e.g. an integer wider than 64 bits; Flask's encoder handles it
+        kwargs.setdefault('default', _json_default)
+        return super().dumps(obj, **kwargs)
 
-app.json_encoder = SafeJSONEncoder
+app.json = OrjsonProvider(app)
 
 UPLOAD_FOLDER = 'inputs'
 OUTPUT_FOLDER = 'outputs'
 Path(UPLOAD_FOLDER).mkdir(exist_ok=True)
 Path(OUTPUT_FOLDER).mkdir(exist_ok=True)
 
-print("Flask app initialized", flush=True)
+# Built once and shared by all requests; runs are serialized because the
+# server is threaded and every run writes the same output files
+_PIPELINE = ETLPipeline(input_dir=UPLOAD_FOLDER, output_dir=OUTPUT_FOLDER)
+_PIPELINE_LOCK = threading.Lock()
+
+# Request logging goes through a MemoryHandler so per-request lines are
+# written to stderr in batches; anything at ERROR flushes the buffer at once
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if os.environ.get('ETL_DEBUG') else logging.INFO)
+logger.addHandler(MemoryHandler(capacity=1024, flushLevel=logging.ERROR,
+                                target=logging.StreamHandler()))
+logger.propagate = False
+
+logger.info("Flask app initialized")
 
 @app.route('/', methods=['GET'])
 def index():
     """Serve the HTML interface"""
-    try:
-        with open('index.html', 'r', encoding='utf-8') as f:
-            html = f.read()
-        return html, 200, {'Content-Type': 'text/html'}
-    except Exception as e:
-        print(f"Error serving index: {e}", flush=True)
-        traceback.print_exc()
-        return f"Error: {str(e)}", 500
+    return send_from_directory(app.root_path, 'index.html', max_age=3600)
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -50,49 +78,29 @@ def health():
 def process():
     """Process data"""
     try:
-        print("Process request received", flush=True)
-        content = request.get_data(as_text=True)
+        logger.debug("Process request received")
+        body = request.get_data()
         
-        if not content or not content.strip():
+        if not body or not body.strip():
             return jsonify({'error': 'No data provided'}), 400
         
-        # Clean content - remove problematic characters
-        try:
-            content = content.encode('utf-8', errors='replace').decode('utf-8', errors='replace')
-        except:
-            pass
-        
-        print(f"Processing {len(content)} characters", flush=True)
+        logger.debug("Processing %d bytes", len(body))
         
-        # Try to import ETL pipeline
         try:
-            from etl_pipeline import ETLPipeline
-            print("ETL Pipeline imported", flush=True)
-            
-            # Create temp file with UTF-8 encoding
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', dir=UPLOAD_FOLDER, delete=False, encoding='utf-8') as f:
-                f.write(content)
-                temp_filename = os.path.basename(f.name)
-            
-            print(f"Processing file: {temp_filename}", flush=True)
+            # Run pipeline directly on the request body, replacing invalid
+            # UTF-8 bytes as get_data(as_text=True) would
+            with _PIPELINE_LOCK:
+                df, schema = _PIPELINE.run_bytes(body, errors='replace')
             
-            # Run pipeline
-            pipeline = ETLPipeline(input_dir=UPLOAD_FOLDER, output_dir=OUTPUT_FOLDER)
-            df, schema = pipeline.run(temp_filename)
-            
-            print(f"Pipeline completed: {len(df)} records", flush=True)
+            logger.debug("Pipeline completed: %d records", len(df))
             
             # Convert to dict with error handling
             try:
-                # Replace NaN and None with empty strings
-                df = df.fillna('')
-                # Convert all columns to string to ensure JSON serializable
-                for col in df.columns:
-                    df[col] = df[col].astype(str)
-                data = df.to_dict('records')
+                # Missing values become null; numbers and lists are left
+                # for the JSON encoder instead of being stringified per column
+                data = df.astype(object).where(df.notna(), None).to_dict('records')
             except Exception as convert_error:
-                print(f"Conversion error: {convert_error}", flush=True)
-                traceback.print_exc()
+                logger.exception("Conversion error: %s", convert_error)
                 # If conversion still fails, convert everything to string first
                 try:
                     df = df.astype(str).fillna('')
@@ -100,12 +108,6 @@ def process():
                 except:
                     data = []
             
-            # Cleanup
-            try:
-                os.remove(os.path.join(UPLOAD_FOLDER, temp_filename))
-            except:
-                pass
-            
             return jsonify({
                 'success': True,
                 'data': data,
@@ -115,28 +117,22 @@ def process():
                 }
             }), 200
             
-        except ImportError as e:
-            print(f"Import error: {e}", flush=True)
-            return jsonify({'error': f'Import error: {str(e)}'}), 500
         except Exception as pipeline_error:
-            print(f"Pipeline error: {pipeline_error}", flush=True)
-            traceback.print_exc()
+            logger.exception("Pipeline error: %s", pipeline_error)
             return jsonify({'error': f'Processing error: {str(pipeline_error)}'}), 500
             
     except Exception as e:
-        print(f"Request error: {e}", flush=True)
-        traceback.print_exc()
+        logger.exception("Request error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.errorhandler(404)
 def not_found(error):
-    print(f"404 error: {request.path}", flush=True)
+    logger.info("404 error: %s", request.path)
     return jsonify({'error': 'not found'}), 404
 
 @app.errorhandler(500)
 def internal_error(error):
-    print(f"500 error: {error}", flush=True)
-    traceback.print_exc()
+    logger.error("500 error: %s", error, exc_info=True)
     return jsonify({'error': 'internal server error'}), 500
 
 if __name__ == '__main__':
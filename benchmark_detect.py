@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Detection benchmark: inputs that have made JSON detection quadratic before.
+Each case should take time roughly proportional to its size.
+"""
+import json
+import time
+
+from etl_pipeline import ETLPipeline
+
+
+def minified_array(n):
+    """One line holding a JSON array of n small objects"""
+    objs = [{'id': i, 'name': f'item{i}', 'tags': ['a', 'b'], 'v': i * 0.5} for i in range(n)]
+    return 'Catalogue export follows\n' + json.dumps(objs, separators=(',', ':')), n
+
+
+def malformed_lines(n):
+    """n lines, each opening a JSON object that never becomes valid"""
+    return '{"key": broken value here\n' * n, 0
+
+
+def malformed_single_line(n):
+    """n malformed JSON candidates on a single line"""
+    return 'x ' + '{"key": broken value here} ' * n, 0
+
+
+CASES = [
+    (minified_array, (32000, 128000)),
+    (malformed_lines, (20000, 80000)),
+    (malformed_single_line, (20000, 80000)),
+]
+
+
+if __name__ == '__main__':
+    pipeline = ETLPipeline(input_dir='inputs', output_dir='outputs')
+    for make, sizes in CASES:
+        for n in sizes:
+            content, expected = make(n)
+            start = time.perf_counter()
+            detected = pipeline.detect_content_types(content)
+            elapsed = time.perf_counter() - start
+            found = len(detected['json'])
+            status = 'ok' if found == expected else f'expected {expected}'
+            print(f"{make.__name__:<22} n={n:<7} {len(content) / 1e6:6.2f} MB  "
+                  f"{elapsed:6.3f}s  json={found} {status}")
@@ -2,31 +2,312 @@ import os
 import json
 import re
 import base64
+import numpy as np
 import pandas as pd
 import sqlite3
+import mmap
+from contextlib import contextmanager, nullcontext
+import threading
+import multiprocessing
 from pathlib import Path
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
 from typing import Dict, List, Any, Tuple
 import mimetypes
 from datetime import datetime
 import sys
 import io
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib parser
+    orjson = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pa_parquet
+except ImportError:  # pyarrow is optional; only the Parquet copy needs it
+    pa = None
+
 # Fix encoding issues on Windows
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8', errors='replace')
 if sys.stderr.encoding != 'utf-8':
     sys.stderr.reconfigure(encoding='utf-8', errors='replace')
 
+# Record kinds in output order, with the detect_content_types key for each
+SEGMENT_ORDER = [('html', 'html'), ('json', 'json_parsed'), ('text', 'text'), ('media', 'base64')]
+TYPE_ORDER = {kind: rank for rank, (kind, _) in enumerate(SEGMENT_ORDER)}
+
+# Rows per executemany call when saving to SQLite
+DB_BATCH_SIZE = 10000
+
+# Detection patterns - compiled once at import instead of on every file.
+# HTML blocks and the opening brace of a JSON object share one alternation
+# so the content is walked in a single pass; each match reports which group
+# it came from. JSON objects themselves are measured by the decoder below;
+# the lookahead skips braces that cannot open one, since every failed decode
+# costs a scan back to the start of the content to report a line number.
+_HTML_BLOCK = '|'.join((
+    r'<html[^>]*>.*?</html>',
+    r'<!DOCTYPE[^>]*>.*?</html>',
+    r'<div[^>]*>.*?</div>',
+    r'<p[^>]*>.*?</p>',
+    r'<body[^>]*>.*?</body>'
+))
+_BLOCK_PATTERN = re.compile(
+    rf'(?P<html>{_HTML_BLOCK})|(?P<json>\{{(?=\s*["}}]))',
+    re.DOTALL | re.IGNORECASE
+)
+_JSON_DECODER = json.JSONDecoder()
+_JSON_START_PATTERN = re.compile(r'\{(?=\s*["}])')
+# Characters first handed to the decoder for a JSON candidate, and how far
+# before a mid-line cut a truncated object can fail
+_JSON_WINDOW = 1024
+_JSON_CUT_MARGIN = 16
+_NON_BLANK_PATTERN = re.compile(r'\S')
+_LONG_DIGITS_PATTERN = re.compile(r'\d{19,}')
+_NDJSON_LINE_PATTERN = re.compile(r'[^\r\n]+')
+
+# Lines that could hold a paragraph (longer than 5 characters once stripped)
+_LINE_PATTERN = re.compile(r'[^\n]{6,}')
+_DATA_URI_PATTERN = re.compile(r'data:(?:image|text)/[^;]+;base64,([A-Za-z0-9+/=]+)')
+
+# Generic base64 strings are runs of at least this many base64 characters
+# (plus up to two '=' of padding), found with a byte lookup table
+_BASE64_MIN_RUN = 64
+_BASE64_LUT = np.zeros(256, dtype=np.int8)
+_BASE64_LUT[np.frombuffer(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/',
+    dtype=np.uint8)] = 1
+
+# lxml parser objects carry per-parse state and must not be shared between
+# threads, so each thread builds one on first use and reuses it after that
+_HTML_PARSERS = threading.local()
+
+
+def _html_parser():
+    """Return this thread's lxml HTML parser"""
+    parser = getattr(_HTML_PARSERS, 'parser', None)
+    if parser is None:
+        parser = _HTML_PARSERS.parser = lxml_html.HTMLParser()
+    return parser
+
+
+def _find_base64_spans(content: str) -> List[Tuple[int, int]]:
+    """Return the (start, end) span of every run of 64+ base64 characters"""
+    # Non-ASCII characters become '?' so byte offsets equal str offsets
+    buf = np.frombuffer(content.encode('ascii', 'replace'), dtype=np.uint8)
+    is_b64 = _BASE64_LUT[buf]
+    
+    # Run boundaries are where the 0/1 mask steps up (start) or down (end);
+    # int8 padding keeps the mask and its diff at one byte per character
+    pad = np.zeros(1, dtype=np.int8)
+    edges = np.diff(np.concatenate((pad, is_b64, pad)))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    long_runs = ends - starts >= _BASE64_MIN_RUN
+    
+    spans = []
+    for start, end in zip(starts[long_runs].tolist(), ends[long_runs].tolist()):
+        # Include up to two '=' of trailing padding
+        if content.startswith('==', end):
+            end += 2
+        elif content.startswith('=', end):
+            end += 1
+        spans.append((start, end))
+    return spans
+
+
+def _find_base64_blocks(content: str) -> List[str]:
+    """Return each distinct base64 payload in content, in document order"""
+    # A data: URI payload is usually found again by the generic run scan, so
+    # spans are ordered longest-first per start and any span inside an
+    # earlier one is dropped by comparing offsets rather than hashing the
+    # strings
+    spans = [match.span(1) for match in _DATA_URI_PATTERN.finditer(content)]
+    spans.extend(_find_base64_spans(content))
+    spans.sort(key=lambda span: (span[0], -span[1]))
+    blocks = []
+    covered_end = -1
+    for start, end in spans:
+        if end <= covered_end:
+            continue
+        blocks.append(content[start:end])
+        covered_end = end
+    
+    # The same payload repeated elsewhere is still reported once
+    return list(dict.fromkeys(blocks))
+
+
+def _pool_context():
+    """Multiprocessing context for worker pools (forkserver or spawn)"""
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def _decode_json_object(content: str, start: int):
+    """Decode the JSON object at content[start]; return (obj, end offset)
+    
+    The decoder is given a window of the content starting at the object,
+    doubled only while a failure may be down to the window cutting the
+    object short. Success then copies about the object's own length, and so
+    does a malformed candidate: JSONDecodeError works out its line number by
+    scanning from the start of the string it was given, which for the full
+    content would make every failure O(start).
+    """
+    size = _JSON_WINDOW
+    while True:
+        bound = min(start + size, len(content))
+        if bound < len(content):
+            # Prefer to cut just after a newline: JSON strings can't hold a
+            # raw one, so an object cut there can only fail at the very end
+            bound = content.rfind('\n', start, bound) + 1 or bound
+        chunk = content[start:bound]
+        try:
+            obj, end = _JSON_DECODER.raw_decode(chunk)
+            return obj, start + end
+        except json.JSONDecodeError as e:
+            if bound == len(content):
+                raise
+            if chunk.endswith('\n'):
+                if e.pos < len(chunk):
+                    raise
+            # Cut mid-line: a truncated literal, number or escape fails a few
+            # characters before the cut, and a truncated string is reported
+            # where it opened
+            elif (e.pos < len(chunk) - _JSON_CUT_MARGIN
+                  and not e.msg.startswith('Unterminated string')):
+                raise
+        size *= 2
+
+
+def _iter_json_objects(content: str, pos: int, endpos: int):
+    """Yield (start, end, obj) for each JSON object starting in content[pos:endpos]"""
+    while True:
+        match = _JSON_START_PATTERN.search(content, pos, endpos)
+        if match is None:
+            return
+        start = match.start()
+        try:
+            obj, pos = _decode_json_object(content, start)
+        except (ValueError, RecursionError):
+            pos = start + 1
+            continue
+        yield start, pos, obj
+
+
+def _json_loads(s):
+    """Parse a JSON document, using orjson when it is installed"""
+    # orjson silently turns integers wider than 64 bits into floats; any
+    # run of 19+ digits sends the document to the stdlib parser instead
+    if orjson is not None and not _LONG_DIGITS_PATTERN.search(s):
+        return orjson.loads(s)
+    return json.loads(s)
+
+
+def _json_dumps(obj) -> str:
+    """Serialize obj to a compact JSON string, using orjson when installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            pass  # e.g. an integer wider than 64 bits; stdlib json handles it
+    return json.dumps(obj)
+
+
+def _json_dump_file(obj, path):
+    """Write obj to path as indented JSON"""
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            pass  # e.g. an integer wider than 64 bits; stdlib json handles it
+        else:
+            with open(path, 'wb') as f:
+                f.write(data)
+            return
+    with open(path, 'w') as f:
+        json.dump(obj, f, indent=2)
+
+
+def _split_ndjson(content: str):
+    """Return (line, parsed object) pairs for an NDJSON document, or None
+    if content isn't one"""
+    # Look at the first non-blank character without copying content, then
+    # walk the lines lazily so a non-NDJSON input is rejected at its first
+    # bad line instead of after splitting the whole document
+    first = _NON_BLANK_PATTERN.search(content)
+    if first is None or first.group() != '{':
+        return None
+    
+    lines = []
+    for match in _NDJSON_LINE_PATTERN.finditer(content):
+        line = match.group().strip()
+        if not line:
+            continue
+        if not line.startswith('{'):
+            return None
+        try:
+            lines.append((line, _json_loads(line)))
+        except ValueError:
+            return None
+    return lines
+
+
+def _write_parquet(df: pd.DataFrame, path) -> bool:
+    """Write df as Parquet; False if pyarrow is missing or can't encode df"""
+    if pa is None:
+        return False
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pa_parquet.write_table(table, path)
+        return True
+    except (pa.ArrowException, OverflowError, TypeError, ValueError):
+        # e.g. a column mixing strings and numbers has no single Arrow type,
+        # or an integer wider than 64 bits
+        return False
+
+
+def _records_to_columns(records: List[Dict], skip=()) -> Dict[str, List]:
+    """Transpose row dicts into equal-length column lists (None where missing)"""
+    columns = {}
+    for row, record in enumerate(records):
+        for key, value in record.items():
+            if key in skip:
+                continue
+            column = columns.setdefault(key, [])
+            if len(column) < row:
+                column.extend([None] * (row - len(column)))
+            column.append(value)
+    for column in columns.values():
+        column.extend([None] * (len(records) - len(column)))
+    return columns
+
+
 class ETLPipeline:
-    def __init__(self, input_dir="inputs", output_dir="outputs", use_db=False):
+    def __init__(self, input_dir="inputs", output_dir="outputs", use_db=False,
+                 write_parquet=False, output_lock=None):
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
-        self.extracted_data = []
-        self.schema = {}
         self.use_db = use_db
+        self.write_parquet = write_parquet
+        # Optional zero-argument callable returning a context manager that is
+        # held while the output files are written, for callers whose runs
+        # share output_dir across processes
+        self.output_lock = output_lock
         self.db_path = self.output_dir / "etl_data.db" if use_db else None
+        self._conn = None
+        self._reset_state()
+        
+        if use_db:
+            self._init_database()
+    
+    def _reset_state(self):
+        """Clear per-run state so one instance can process many inputs"""
+        self.extracted_data = []
+        self.schema = {}
         self.processing_metadata = {
             'start_time': None,
             'end_time': None,
@@ -35,114 +316,151 @@ class ETLPipeline:
             'items_by_type': {}
         }
         
-        if use_db:
-            self._init_database()
-        
-    def read_file(self, filename: str) -> str:
-        """Step 1: Read the entire mixed file"""
+    @contextmanager
+    def _map_input(self, filename: str):
+        """Yield a read-only memory map of an input file (b'' if it's empty)"""
         filepath = self.input_dir / filename
         if not filepath.exists():
             raise FileNotFoundError(f"File not found: {filepath}")
         
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            try:
-                with open(filepath, 'r', encoding='latin-1') as f:
-                    return f.read()
-            except Exception as e:
-                raise ValueError(f"Cannot read file with available encodings: {str(e)}")
+        with open(filepath, 'rb') as f:
+            # mmap refuses zero-length files
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b''
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+    
+    def read_file(self, filename: str) -> str:
+        """Step 1: Read the entire mixed file"""
+        # Decoded straight from the mapped pages, without first copying the
+        # raw bytes into a separate buffer
+        with self._map_input(filename) as data:
+            return self._decode_content(data)
     
     def detect_content_types(self, content: str) -> Dict[str, List[str]]:
         """Detect different content types in the mixed file"""
         detected = {
             'html': [],
             'json': [],
+            'json_parsed': [],  # the decoded object for each 'json' entry
             'text': [],
             'base64': []
         }
         
-        # Detect HTML blocks - more comprehensive patterns
-        html_patterns = [
-            r'<html[^>]*>.*?</html>',
-            r'<!DOCTYPE[^>]*>.*?</html>',
-            r'<div[^>]*>.*?</div>',
-            r'<p[^>]*>.*?</p>',
-            r'<body[^>]*>.*?</body>'
-        ]
-        for pattern in html_patterns:
-            html_matches = re.findall(pattern, content, re.DOTALL | re.IGNORECASE)
-            detected['html'].extend(html_matches)
-        
-        # Remove duplicates
-        detected['html'] = list(set(detected['html']))
-        
-        # Detect JSON blocks - improved pattern
-        json_pattern = r'\{(?:[^{}]|(?:\{[^{}]*\}))*\}'
-        json_matches = re.findall(json_pattern, content, re.DOTALL)
-        for match in json_matches:
-            try:
-                json.loads(match)
-                if match not in detected['json']:
-                    detected['json'].append(match)
-            except:
-                pass
+        # Fast path: newline-delimited JSON is one object per line, so the
+        # HTML/text scans can be skipped. Base64 inside the objects is still
+        # reported, as it is for JSON blocks in mixed content.
+        ndjson_lines = _split_ndjson(content)
+        if ndjson_lines is not None:
+            json_blocks = dict(ndjson_lines)
+            detected['json'] = list(json_blocks)
+            detected['json_parsed'] = list(json_blocks.values())
+            detected['base64'] = _find_base64_blocks(content)
+            return detected
+        
+        # Detect HTML and JSON blocks in one scan. HTML nested inside an
+        # earlier match (e.g. <p> inside <body>) is part of that match and is
+        # not reported again on its own, but JSON objects inside HTML still
+        # are. JSON objects are decoded in place with raw_decode, which
+        # validates the object and finds where it ends in one step, at any
+        # nesting depth. The (start, end) span of every accepted block is
+        # kept so plain text can be cut out afterwards.
+        spans = []
+        json_blocks = {}  # block text -> decoded object, in document order
+        pos = 0
+        while True:
+            match = _BLOCK_PATTERN.search(content, pos)
+            if match is None:
+                break
+            start = match.start()
+            if match.lastgroup == 'html':
+                end = match.end()
+                detected['html'].append(content[start:end])
+                # JSON embedded in the HTML is reported as well; an object
+                # running past the closing tag extends the span
+                for obj_start, obj_end, obj in _iter_json_objects(content, start, end):
+                    json_blocks.setdefault(content[obj_start:obj_end], obj)
+                    end = max(end, obj_end)
+            else:
+                try:
+                    obj, end = _decode_json_object(content, start)
+                except (ValueError, RecursionError):
+                    # Not an object (or nested too deep to decode); keep
+                    # looking past this brace
+                    pos = start + 1
+                    continue
+                json_blocks.setdefault(content[start:end], obj)
+            spans.append((start, end))
+            pos = end
+        
+        # Remove duplicates, keeping document order. The decoded JSON
+        # objects are kept so extraction doesn't parse them a second time.
+        detected['html'] = list(dict.fromkeys(detected['html']))
+        detected['json'] = list(json_blocks)
+        detected['json_parsed'] = list(json_blocks.values())
         
         # Detect base64 encoded data
-        base64_patterns = [
-            r'data:image/[^;]+;base64,([A-Za-z0-9+/=]+)',
-            r'data:text/[^;]+;base64,([A-Za-z0-9+/=]+)',
-            r'([A-Za-z0-9+/]{64,}={0,2})'  # Generic base64 strings
-        ]
-        for pattern in base64_patterns:
-            base64_matches = re.findall(pattern, content)
-            detected['base64'].extend(base64_matches)
-        
-        detected['base64'] = list(set(detected['base64']))
-        
-        # Extract plain text (everything else)
-        remaining_text = content
-        for html in detected['html']:
-            remaining_text = remaining_text.replace(html, '')
-        for json_str in detected['json']:
-            remaining_text = remaining_text.replace(json_str, '')
-        
-        # Split into paragraphs
-        paragraphs = [p.strip() for p in remaining_text.split('\n') if p.strip() and len(p.strip()) > 5]
-        detected['text'] = paragraphs
+        detected['base64'] = _find_base64_blocks(content)
+        
+        # Extract plain text (everything else): the gaps between the block
+        # spans, joined in one go rather than str.replace per block
+        gaps = []
+        pos = 0
+        for start, end in spans:
+            gaps.append(content[pos:start])
+            pos = end
+        gaps.append(content[pos:])
+        remaining_text = ''.join(gaps)
+        
+        # Split into paragraphs. Lines too short to qualify are skipped by
+        # the regex itself; the rest are stripped once and checked again
+        detected['text'] = [line for line in (match.group().strip()
+                                              for match in _LINE_PATTERN.finditer(remaining_text))
+                            if len(line) > 5]
         
         return detected
     
-    def extract_html(self, html_string: str) -> Dict[str, Any]:
+    @staticmethod
+    def extract_html(html_string: str) -> Dict[str, Any]:
         """Extract data from HTML - only keep: type, title, word_count"""
-        soup = BeautifulSoup(html_string, 'html.parser')
+        try:
+            tree = lxml_html.fromstring(html_string, parser=_html_parser())
+        except (etree.ParserError, ValueError):
+            # e.g. a doctype/comment-only block has no elements to parse
+            return {'type': 'html', 'title': '', 'word_count': 0}
         
         return {
             'type': 'html',
-            'title': soup.title.string if soup.title else '',
-            'word_count': len(soup.get_text().split())
+            'title': tree.findtext('.//title') or '',
+            'word_count': len(tree.text_content().split())
         }
     
-    def extract_json(self, json_string: str) -> Dict[str, Any]:
+    @staticmethod
+    def extract_json(json_string: str) -> Dict[str, Any]:
         """Extract and flatten JSON data - NO word_count/title (JSON has its own fields)"""
         try:
-            data = json.loads(json_string)
-            flattened = self.flatten_dict(data)
-            # IMPORTANT: Only add type, don't add word_count/title
-            # JSON objects have their own natural fields
-            flattened['type'] = 'json'
-            return flattened
+            return ETLPipeline.extract_json_object(_json_loads(json_string))
         except:
             return {'type': 'json', 'error': 'Invalid JSON', 'raw': json_string[:100]}
     
-    def flatten_dict(self, d: Dict, parent_key: str = '', sep: str = '_') -> Dict:
+    @staticmethod
+    def extract_json_object(data: Dict) -> Dict[str, Any]:
+        """Flatten an already-decoded JSON object into a record"""
+        flattened = ETLPipeline.flatten_dict(data)
+        # IMPORTANT: Only add type, don't add word_count/title
+        # JSON objects have their own natural fields
+        flattened['type'] = 'json'
+        return flattened
+    
+    @staticmethod
+    def flatten_dict(d: Dict, parent_key: str = '', sep: str = '_') -> Dict:
         """Flatten nested dictionary - preserves arrays and primitives"""
         items = []
         for k, v in d.items():
             new_key = f"{parent_key}{sep}{k}" if parent_key else k
             if isinstance(v, dict):
-                items.extend(self.flatten_dict(v, new_key, sep=sep).items())
+                items.extend(ETLPipeline.flatten_dict(v, new_key, sep=sep).items())
             elif isinstance(v, list):
                 # Keep arrays as lists, don't convert to JSON string
                 items.append((new_key, v))
@@ -150,7 +468,8 @@ class ETLPipeline:
                 items.append((new_key, v))
         return dict(items)
     
-    def extract_text(self, text: str) -> Dict[str, Any]:
+    @staticmethod
+    def extract_text(text: str) -> Dict[str, Any]:
         """Extract data from plain text - only keep: type, title, word_count"""
         return {
             'type': 'text',
@@ -158,7 +477,8 @@ class ETLPipeline:
             'word_count': len(text.split())
         }
     
-    def extract_media(self, base64_data: str) -> Dict[str, Any]:
+    @staticmethod
+    def extract_media(base64_data: str) -> Dict[str, Any]:
         """Extract media metadata - only keep: type, title, word_count"""
         return {
             'type': 'media',
@@ -170,101 +490,80 @@ class ETLPipeline:
         """Step 2: Extract data from all content types"""
         detected = self.detect_content_types(content)
         
-        # Process HTML
-        for idx, html in enumerate(detected['html']):
-            extracted = self.extract_html(html)
-            extracted['source_index'] = f"html_{idx}"
-            self.extracted_data.append(extracted)
-        
-        # Process JSON
-        for idx, json_str in enumerate(detected['json']):
-            extracted = self.extract_json(json_str)
-            extracted['source_index'] = f"json_{idx}"
-            self.extracted_data.append(extracted)
-        
-        # Process Text
-        for idx, text in enumerate(detected['text']):
-            extracted = self.extract_text(text)
-            extracted['source_index'] = f"text_{idx}"
-            self.extracted_data.append(extracted)
-        
-        # Process Media
-        for idx, media in enumerate(detected['base64']):
-            extracted = self.extract_media(media)
-            extracted['source_index'] = f"media_{idx}"
+        # One (kind, payload) segment per detected block, in output order
+        segments = [(kind, payload)
+                    for kind, key in SEGMENT_ORDER
+                    for payload in detected[key]]
+        records = [parse_segment(segment) for segment in segments]
+        
+        counts = {}
+        for (kind, _), extracted in zip(segments, records):
+            idx = counts.get(kind, 0)
+            counts[kind] = idx + 1
+            extracted['source_index'] = f"{kind}_{idx}"
             self.extracted_data.append(extracted)
     
-    def infer_schema(self):
-        """Step 3: Build dynamic schema from extracted data"""
-        all_keys = set()
+    def infer_schema_from_df(self, df: pd.DataFrame):
+        """Step 4: Build dynamic schema from the normalized DataFrame"""
+        # Nullability and presence are column-wise reductions over the
+        # frame rather than per-record dict lookups
+        nullable = df.isna().any()
+        present_in = df.notna().sum()
+        self.schema = {
+            col: {
+                'type': [str(dtype)],
+                'nullable': bool(nullable[col]),
+                'present_in': int(present_in[col])
+            }
+            for col, dtype in df.dtypes.items()
+        }
+    
+    def _infer_schema_legacy(self):
+        """Build dynamic schema from the extracted records (pre-DataFrame)"""
+        # Single pass over every record: collect per-key value types,
+        # presence counts and whether an explicit None was seen
+        value_types = {}
+        present_in = {}
+        has_none = set()
         for item in self.extracted_data:
-            all_keys.update(item.keys())
-        
-        # Build schema with type inference
-        for key in all_keys:
-            values = [item.get(key) for item in self.extracted_data if key in item]
-            value_types = set(type(v).__name__ for v in values if v is not None)
-            
+            for key, value in item.items():
+                present_in[key] = present_in.get(key, 0) + 1
+                if value is None:
+                    has_none.add(key)
+                else:
+                    value_types.setdefault(key, set()).add(type(value).__name__)
+        
+        # A key is nullable if it is None somewhere or missing from a record
+        total = len(self.extracted_data)
+        for key, count in present_in.items():
+            types = value_types.get(key)
             self.schema[key] = {
-                'type': list(value_types) if value_types else ['NoneType'],
-                'nullable': any(v is None for v in [item.get(key) for item in self.extracted_data]),
-                'present_in': sum(1 for item in self.extracted_data if key in item)
+                'type': list(types) if types else ['NoneType'],
+                'nullable': key in has_none or count < total,
+                'present_in': count
             }
-        
-        # Fill missing values with None
-        for item in self.extracted_data:
-            for key in all_keys:
-                if key not in item:
-                    item[key] = None
     
     def normalize(self) -> pd.DataFrame:
-        """Step 4: Normalize data into DataFrame with total_items
+        """Step 3: Normalize data into DataFrame with total_items
         
         Key Strategy: Keep record types separate in their own row groups to avoid
         polluting HTML/Text records with JSON fields when mixed content is processed.
         """
-        # Remove word_count and title from all records - they're extraction artifacts
-        cleaned_data = []
-        for record in self.extracted_data:
-            cleaned = {k: v for k, v in record.items() if k not in ['word_count', 'title']}
-            cleaned_data.append(cleaned)
-        
-        # Group by type to keep fields separate
-        grouped_by_type = {}
-        for record in cleaned_data:
-            record_type = record.get('type', 'unknown')
-            if record_type not in grouped_by_type:
-                grouped_by_type[record_type] = []
-            grouped_by_type[record_type].append(record)
-        
-        # Build DataFrame with type-specific columns
-        all_rows = []
-        for record_type in ['html', 'json', 'text', 'media']:  # Process in order
-            if record_type not in grouped_by_type:
-                continue
-            
-            type_records = grouped_by_type[record_type]
-            type_df = pd.DataFrame(type_records)
-            
-            # Only include type-specific fields + core fields
-            # For each type, keep only the columns that actually have data
-            core_fields = ['type', 'source_index']
-            type_specific = [col for col in type_df.columns if col not in core_fields]
-            
-            # Reorder columns: core first, then type-specific
-            cols_to_keep = core_fields + type_specific
-            type_df = type_df[cols_to_keep]
-            
-            all_rows.append(type_df)
-        
-        # Combine all type groups
-        if all_rows:
-            df = pd.concat(all_rows, ignore_index=True, sort=False)
-        else:
-            df = pd.DataFrame()
-        
-        if len(df) == 0:
-            return df
+        # Order rows by type (html, json, text, media); the sort is stable so
+        # records keep their extraction order within a type. Unknown types
+        # are left out.
+        records = sorted(
+            (record for record in self.extracted_data
+             if record.get('type', 'unknown') in TYPE_ORDER),
+            key=lambda record: TYPE_ORDER[record['type']]
+        )
+        if not records:
+            return pd.DataFrame()
+        
+        # Build the frame once from columns rather than row dicts, dropping
+        # word_count and title - they're extraction artifacts. Fields a
+        # record type doesn't have are simply empty for its rows.
+        df = pd.DataFrame(_records_to_columns(records, skip=('word_count', 'title')))
         
         # Add total_items column to every row
         total_items = len(df)
@@ -284,25 +583,31 @@ class ETLPipeline:
         return df
     
     def load(self, df: pd.DataFrame, output_csv="cleaned_output.csv", 
-             schema_json="dynamic_schema.json"):
+             schema_json="dynamic_schema.json", metadata_json="processing_metadata.json"):
         """Step 5: Save outputs"""
         # Save CSV
         csv_path = self.output_dir / output_csv
         df.to_csv(csv_path, index=False)
         print(f"Saved cleaned data to: {csv_path}")
         
+        # Save a columnar Parquet copy alongside if enabled
+        if self.write_parquet:
+            parquet_path = csv_path.with_suffix('.parquet')
+            if _write_parquet(df, parquet_path):
+                print(f"Saved Parquet copy to: {parquet_path}")
+            else:
+                print("Warning: Could not write Parquet copy (pyarrow missing or unsupported column types)")
+        
         # Save schema
         schema_path = self.output_dir / schema_json
-        with open(schema_path, 'w') as f:
-            json.dump(self.schema, f, indent=2)
+        _json_dump_file(self.schema, schema_path)
         print(f"Saved schema to: {schema_path}")
         
         # Save metadata
-        metadata_path = self.output_dir / "processing_metadata.json"
+        metadata_path = self.output_dir / metadata_json
         self.processing_metadata['end_time'] = datetime.now().isoformat()
         self.processing_metadata['total_items'] = len(df)
-        with open(metadata_path, 'w') as f:
-            json.dump(self.processing_metadata, f, indent=2)
+        _json_dump_file(self.processing_metadata, metadata_path)
         print(f"Saved metadata to: {metadata_path}")
         
         # Save to SQLite if enabled
@@ -317,10 +622,24 @@ class ETLPipeline:
         
         return csv_path, schema_path
     
+    def _connect_db(self) -> sqlite3.Connection:
+        """Open the SQLite database, tuned for bulk single-writer inserts"""
+        # Runs may come from another thread than the one that built the
+        # pipeline (e.g. watch mode), but never from two at once
+        conn = sqlite3.connect(str(self.db_path), isolation_level=None,
+                               check_same_thread=False)
+        # WAL with synchronous=NORMAL syncs at checkpoints rather than on
+        # every commit; temp tables and a 64 MiB page cache stay in memory
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-65536')
+        return conn
+    
     def _init_database(self):
-        """Initialize SQLite database"""
+        """Initialize SQLite database and open the connection runs will share"""
         try:
-            conn = sqlite3.connect(str(self.db_path))
+            conn = self._connect_db()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -343,54 +662,112 @@ class ETLPipeline:
                 )
             ''')
             
-            conn.commit()
-            conn.close()
+            self._conn = conn
             print(f"SQLite database initialized: {self.db_path}")
         except Exception as e:
             print(f"Warning: Could not initialize database: {str(e)}")
     
     def _save_to_db(self, df: pd.DataFrame):
         """Save processed data to SQLite database"""
+        if self._conn is None:
+            print("Warning: Could not save to database: no open connection")
+            return
+        
+        # The connection lives as long as the pipeline, so the INSERT
+        # statements stay in its prepared-statement cache between runs
+        conn = self._conn
         try:
-            conn = sqlite3.connect(str(self.db_path))
             cursor = conn.cursor()
             
-            # Insert data
-            for _, row in df.iterrows():
-                data_json = json.dumps(row.to_dict())
-                data_type = row.get('type', 'unknown')
-                source_index = row.get('source_index', '')
-                
-                cursor.execute('''
+            # Insert data in batches, all inside one explicit transaction.
+            # Missing values are masked to None for the whole frame at once,
+            # so data_json gets null rather than NaN (which isn't valid JSON)
+            filename = self.processing_metadata['filename']
+            records = df.astype(object).where(df.notna(), None).to_dict('records')
+            conn.execute('BEGIN')
+            for start in range(0, len(records), DB_BATCH_SIZE):
+                cursor.executemany('''
                     INSERT INTO processed_data (filename, source_index, data_type, data_json)
                     VALUES (?, ?, ?, ?)
-                ''', (self.processing_metadata['filename'], source_index, data_type, data_json))
+                ''', [(filename, record.get('source_index', ''),
+                       record.get('type', 'unknown'), _json_dumps(record))
+                      for record in records[start:start + DB_BATCH_SIZE]])
             
             # Insert schema
-            schema_json = json.dumps(self.schema)
+            schema_json = _json_dumps(self.schema)
             cursor.execute('''
                 INSERT INTO schemas (filename, schema_json)
                 VALUES (?, ?)
             ''', (self.processing_metadata['filename'], schema_json))
             
             conn.commit()
-            conn.close()
             print(f"Data saved to SQLite database")
         except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
             print(f"Warning: Could not save to database: {str(e)}")
     
-    def run(self, filename: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
-        """Run the complete ETL pipeline"""
+    def close(self):
+        """Close the SQLite connection, if one is open"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+    
+    def _decode_content(self, data, errors=None) -> str:
+        """Decode a raw input buffer (UTF-8, falling back to Latin-1)
+        
+        With an errors handler (e.g. 'replace') the buffer is decoded as
+        UTF-8 using it instead, so a stray invalid byte doesn't switch the
+        whole buffer to Latin-1.
+        """
+        if errors is not None:
+            return str(data, 'utf-8', errors)
+        try:
+            return str(data, 'utf-8')
+        except UnicodeDecodeError:
+            return str(data, 'latin-1')
+    
+    def run(self, filename: str, per_file_outputs: bool = False) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Run the complete ETL pipeline on a file from the input folder
+        
+        With per_file_outputs the output files are named after the input
+        (cleaned_<stem>.csv, schema_<stem>.json, metadata_<stem>.json), so
+        several files can be processed side by side without overwriting
+        each other's results.
+        """
+        output_names = {}
+        if per_file_outputs:
+            stem = Path(filename).stem
+            output_names = {
+                'output_csv': f"cleaned_{stem}.csv",
+                'schema_json': f"schema_{stem}.json",
+                'metadata_json': f"metadata_{stem}.json"
+            }
+        with self._map_input(filename) as data:
+            return self._process_buffer(data, filename, **output_names)
+    
+    def run_bytes(self, data: bytes, name: str = "upload",
+                  errors: str = None) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Run the complete ETL pipeline on an in-memory buffer (no temp file)
+        
+        errors is the UTF-8 error handler for the buffer; see _decode_content.
+        """
+        return self._process_buffer(data, name, errors=errors)
+    
+    def _process_buffer(self, data, name: str, errors: str = None,
+                        **output_names) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+        """Steps 1-5 over a bytes-like buffer (bytes, memoryview or mmap)"""
+        self._reset_state()
         self.processing_metadata['start_time'] = datetime.now().isoformat()
-        self.processing_metadata['filename'] = filename
+        self.processing_metadata['filename'] = name
         
-        print(f"Starting ETL Pipeline for: {filename}")
+        print(f"Starting ETL Pipeline for: {name}")
         print("=" * 50)
         
         try:
             # Step 1: Read
-            print("\n[1] Reading file...")
-            content = self.read_file(filename)
+            print("\n[1] Reading input...")
+            content = self._decode_content(data, errors)
             print(f"   File size: {len(content)} characters")
             
             # Step 2: Extract
@@ -404,19 +781,20 @@ class ETLPipeline:
                 self.processing_metadata['items_by_type'][item_type] = \
                     self.processing_metadata['items_by_type'].get(item_type, 0) + 1
             
-            # Step 3: Infer Schema
-            print("\n[3] Inferring schema...")
-            self.infer_schema()
-            print(f"   Schema with {len(self.schema)} fields")
-            
-            # Step 4: Normalize
-            print("\n[4] Normalizing data...")
+            # Step 3: Normalize
+            print("\n[3] Normalizing data...")
             df = self.normalize()
             print(f"   Created DataFrame: {df.shape}")
             
+            # Step 4: Infer Schema
+            print("\n[4] Inferring schema...")
+            self.infer_schema_from_df(df)
+            print(f"   Schema with {len(self.schema)} fields")
+            
             # Step 5: Load
             print("\n[5] Loading outputs...")
-            csv_path, schema_path = self.load(df)
+            with self.output_lock() if self.output_lock else nullcontext():
+                csv_path, schema_path = self.load(df, **output_names)
             
             print("\nETL Pipeline completed successfully!")
             print("=" * 50)
@@ -430,6 +808,21 @@ class ETLPipeline:
             raise
 
 
+# Extractor for each segment kind produced by ETLPipeline.extract
+_SEGMENT_EXTRACTORS = {
+    'html': ETLPipeline.extract_html,
+    'json': ETLPipeline.extract_json_object,
+    'text': ETLPipeline.extract_text,
+    'media': ETLPipeline.extract_media
+}
+
+
+def parse_segment(segment: Tuple[str, Any]) -> Dict[str, Any]:
+    """Extract one (kind, payload) segment with the extractor for its kind"""
+    kind, payload = segment
+    return _SEGMENT_EXTRACTORS[kind](payload)
+
+
 if __name__ == "__main__":
     # Example usage
     pipeline = ETLPipeline()
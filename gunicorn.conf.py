@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for serving the web interface in production
+Usage: gunicorn -c gunicorn.conf.py app:app
+"""
+
+import multiprocessing
+
+bind = '127.0.0.1:5000'
+
+# Processes for the CPU-heavy pipeline, threads for concurrent requests
+# within each process. app.py serializes pipeline runs per process, and
+# takes a file lock on outputs/ while writing so workers don't interleave
+# their output files; outputs/ always holds the last completed run.
+worker_class = 'gthread'
+workers = multiprocessing.cpu_count()
+threads = 4
+
+# Keep the app import after the fork: every worker then builds its own
+# ETLPipeline and compiled patterns instead of inheriting the master's
+preload_app = False
@@ -6,8 +6,11 @@ No fancy APIs, just straightforward file processing
 import os
 import sys
 from pathlib import Path
-from etl_pipeline import ETLPipeline
+from concurrent.futures import ProcessPoolExecutor
+from etl_pipeline import ETLPipeline, _pool_context
 import time
+import queue
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
@@ -17,22 +20,61 @@ class InputFileHandler(FileSystemEventHandler):
     
     def __init__(self, output_callback):
         self.output_callback = output_callback
+        # New files are queued and processed on a worker thread, so the
+        # observer thread never blocks while a file is written or processed
+        self.queue = queue.Queue()
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
     
     def on_created(self, event):
-        if event.is_dir:
+        if event.is_directory:
             return
         
-        # Wait a moment for the file to be fully written
-        time.sleep(1)
-        
-        filename = Path(event.src_path).name
-        print(f"\nNew file detected: {filename}")
-        
-        # Process the file
-        try:
-            self.output_callback(filename)
-        except Exception as e:
-            print(f"Error processing file: {str(e)}")
+        print(f"\nNew file detected: {Path(event.src_path).name}")
+        self.queue.put(event.src_path)
+    
+    def stop(self):
+        """Finish the files already queued, then end the worker thread"""
+        self.queue.put(None)
+        self.worker.join()
+    
+    def _worker(self):
+        """Process queued files one at a time, once they're fully written"""
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            path = Path(item)
+            try:
+                # Wait for the file to be fully written: its size has to
+                # hold steady across two reads half a second apart
+                size = -1
+                while path.exists() and path.stat().st_size != size:
+                    size = path.stat().st_size
+                    time.sleep(0.5)
+                if not path.exists():
+                    continue
+                
+                # Process the file
+                self.output_callback(path.name)
+            except Exception as e:
+                print(f"Error processing file: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+
+def _run_one(args):
+    """Run the pipeline on one input file - module level so it pickles"""
+    filename, input_dir, output_dir, use_db = args
+    pipeline = ETLPipeline(input_dir=input_dir, output_dir=output_dir, use_db=use_db)
+    try:
+        pipeline.run(filename, per_file_outputs=True)
+        return filename, None
+    except Exception as e:
+        return filename, str(e)
+    finally:
+        pipeline.close()
 
 
 class SimpleETL:
@@ -45,6 +87,10 @@ class SimpleETL:
         self.watch_mode = watch_mode
         self.pipeline = ETLPipeline(input_dir=input_dir, output_dir=output_dir, use_db=use_db)
     
+    def close(self):
+        """Release the pipeline's database connection"""
+        self.pipeline.close()
+    
     def process_file(self, filename):
         """Process a single file through the ETL pipeline"""
         print("\n" + "="*60)
@@ -81,6 +127,11 @@ class SimpleETL:
             print("\nStopping file watcher...")
             observer.stop()
         observer.join()
+        # The pipeline is shared with the other menu actions, so don't
+        # return while the worker may still be running it
+        if not handler.queue.empty():
+            print("Finishing queued files...")
+        handler.stop()
     
     def process_existing_files(self):
         """Process all files currently in the input folder"""
@@ -96,10 +147,21 @@ class SimpleETL:
         
         print(f"\nFound {len(files)} file(s) to process")
         
-        for file_path in files:
-            filename = file_path.name
-            self.process_file(filename)
-            print("\n" + "-"*60 + "\n")
+        # Each file gets its own pipeline in a worker process, and outputs
+        # named after the input so the files don't overwrite each other.
+        # Workers are never plain-forked: this process may have threads or
+        # an open SQLite connection from earlier menu actions.
+        args = [(f.name, self.input_dir, self.output_dir, self.use_db) for f in files]
+        workers = min(len(files), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as executor:
+            results = list(executor.map(_run_one, args))
+        
+        print("\n" + "-"*60)
+        for filename, error in results:
+            if error is None:
+                print(f"Success: {filename} -> /{self.output_dir}/cleaned_{Path(filename).stem}.csv")
+            else:
+                print(f"Failed: {filename} ({error})")
 
 
 def setup_directories():
@@ -143,9 +205,11 @@ def view_outputs():
         size_mb = size / (1024 * 1024)
         print(f"   {file.name} ({size_mb:.2f} MB)")
     
-    # Show latest metadata
-    metadata_file = output_path / "processing_metadata.json"
-    if metadata_file.exists():
+    # Show latest metadata (processing_metadata.json or a per-file
+    # metadata_<stem>.json, whichever was written last)
+    metadata_files = list(output_path.glob('*metadata*.json'))
+    if metadata_files:
+        metadata_file = max(metadata_files, key=lambda f: f.stat().st_mtime)
         import json
         with open(metadata_file, 'r') as f:
             metadata = json.load(f)
@@ -167,14 +231,17 @@ def main():
             # Watch mode
             etl = SimpleETL(use_db=False, watch_mode=True)
             etl.start_watch_mode()
+            etl.close()
         elif command == "process":
             # Process existing files
             etl = SimpleETL(use_db=False)
             etl.process_existing_files()
+            etl.close()
         elif command == "db":
             # Process with database
             etl = SimpleETL(use_db=True)
             etl.process_existing_files()
+            etl.close()
         else:
             print(f"Unknown command: {command}")
             print("\nUsage:")
@@ -183,23 +250,22 @@ def main():
             print("  python main.py process      (Process existing files)")
             print("  python main.py db           (Process with SQLite database)")
     else:
-        # Interactive menu
+        # Interactive menu - one pipeline serves every action; it clears its
+        # per-run state at the start of each run
+        etl = SimpleETL(use_db=False)
         while True:
             show_menu()
             choice = input("\nEnter your choice (1-5): ").strip()
             
             if choice == "1":
-                etl = SimpleETL(use_db=False)
                 etl.process_existing_files()
             
             elif choice == "2":
-                etl = SimpleETL(use_db=False, watch_mode=True)
                 etl.start_watch_mode()
             
             elif choice == "3":
                 filename = input("\nEnter filename to process: ").strip()
                 if filename:
-                    etl = SimpleETL(use_db=False)
                     etl.process_file(filename)
                 else:
                     print("No filename provided")
@@ -208,6 +274,7 @@ def main():
                 view_outputs()
             
             elif choice == "5":
+                etl.close()
                 print("\nGoodbye!")
                 break
             